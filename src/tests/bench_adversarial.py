@@ -0,0 +1,110 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import main  # noqa: E402
+from main import HistoryEntry  # noqa: E402
+from test_chat import SCENARIOS  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+# Max CPU time allowed for the whole per-request analysis on worst-case input.
+CPU_BUDGET_S = 0.25
+
+# Pre-hardening patterns, kept only to check results are unchanged on normal text.
+LEGACY = {
+    "URL_RE": re.compile(r"\bhttps?://[^\s<>()]+\b", re.IGNORECASE),
+    "EMAIL_RE": re.compile(r"\b[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+\b"),
+    "REF_TOKEN_RE": re.compile(
+        r"\b(?:REF|REFERENCE|TICKET|CASE|COMPLAINT|ORDER|ORD|POLICY|AWB|APP|BILL|KYC|TXN|TRANSACTION)"
+        r"[-\s:#]*[A-Z0-9][A-Z0-9\-]{3,24}\b",
+        re.IGNORECASE,
+    ),
+    "REF_ONLY_RE": re.compile(r"\bREF[-\s:#]*\d{4,10}\b", re.IGNORECASE),
+}
+
+NORMAL_EXTRA = [
+    "Your ticket TICKET: AB12-9981 is open, REF#123456 and ORDER 55501X.",
+    "Mail billing.support+kyc@secure-bank.co.in or visit https://secure-bank.co.in/kyc?id=42.",
+    "Pay 499 to refunds.desk@okaxis today, case id CASE-77821.",
+]
+
+# -------------------------------------------------
+# ADVERSARIAL INPUTS (each ~ at the configured size limits)
+# -------------------------------------------------
+
+def adversarial_inputs():
+    n = main.MAX_MESSAGE_CHARS
+    return {
+        "dotted run": "a." * n,
+        "email domain run": "x@" + "a-" * n,
+        "email no tld": ("a" * 60 + "@" + "b" * 60 + " ") * (n // 60),
+        "repeated scheme": "http://" * n,
+        "ref separators": "REF" + "-" * n * 2,
+        "ref tokens": "REF " * n,
+        "at signs": "a@" * n,
+        "digit run": "9" * n * 2,
+        "whitespace": " \t\n" * n,
+        "mixed": ("share otp urgent a.b-c@d.e " * n)[: n * 2],
+    }
+
+
+def analyze(history, text):
+    # same CPU work detect_scam does per turn (minus the LLM)
+    text = main.clip_text(text)
+    main.calculate_scam_score(text)
+    preview = main.extract_intelligence(history, text)
+    main._next_hint("bench", text, preview)
+
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def check_equivalence():
+    texts = [m for s in SCENARIOS for m in s["messages"]] + NORMAL_EXTRA
+    texts.append(" ".join(texts))
+    for name, legacy in LEGACY.items():
+        current = getattr(main, name)
+        for t in texts:
+            assert legacy.findall(t) == current.findall(t), f"{name} differs on: {t!r}"
+    for t in texts:
+        assert main.norm(t) == re.sub(r"\s+", " ", t.lower()).strip()
+    print(f"Equivalence on {len(texts)} normal inputs: OK")
+
+
+def run_all():
+    print("\nADVERSARIAL INPUT BENCHMARK")
+    print("=" * 70)
+    check_equivalence()
+
+    worst = 0.0
+    print(f"\n{'input':>18} | {'chars':>8} | {'cpu s (msg)':>11} | {'cpu s (full history)':>20}")
+    print("-" * 70)
+    for name, text in adversarial_inputs().items():
+        start = time.process_time()
+        analyze([], text)
+        single = time.process_time() - start
+
+        # full server-side history of clipped hostile messages
+        history = [HistoryEntry("scammer", main.clip_text(text), None)] * main.SESSION_HISTORY_MAX
+        start = time.process_time()
+        analyze(history, text)
+        full = time.process_time() - start
+
+        worst = max(worst, single, full)
+        print(f"{name:>18} | {len(text):>8} | {single:>11.4f} | {full:>20.4f}")
+
+    print("=" * 70)
+    print(f"Worst per-request CPU: {worst:.4f}s (budget {CPU_BUDGET_S}s)")
+    assert worst <= CPU_BUDGET_S, "per-request CPU budget exceeded"
+
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import random
+
+# main.py is only used for its analytics store; no LLM calls
+os.environ.setdefault("GROQ_API_KEY", "bench-only")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import SessionAnalytics, ARTIFACT_FIELDS  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+ROWS = [100_000, 1_000_000, 2_000_000]
+SPAN_S = 7 * 24 * 3600
+SCAM_TYPES = ["bank_fraud", "upi_fraud", "phishing", "job_scam", "investment_scam", "kyc_scam", "utility_scam", "unknown"]
+
+# -------------------------------------------------
+# HELPERS
+# -------------------------------------------------
+
+def fill(store, n, now):
+    rng = random.Random(7)
+    step = SPAN_S / n
+    for i in range(n):
+        final = {
+            "scamType": rng.choice(SCAM_TYPES),
+            "confidenceLevel": rng.random(),
+            "totalMessagesExchanged": 16 + 2 * rng.randint(0, 2),
+            "extractedIntelligence": {f: ["x"] * rng.randint(0, 2) for f in ARTIFACT_FIELDS},
+        }
+        store.add(final, turns=rng.randint(8, 10), duration_s=rng.randint(60, 400), ts=now - SPAN_S + i * step)
+
+
+def check_against_naive(store, now):
+    # brute-force the last 6 hours for one scam type
+    since = now - 6 * 3600
+    fast = store.query(since, now + 1, 3600, "phishing")["total"]
+    rows = [i for i in range(store.head, len(store.ts)) if store.ts[i] >= since and store.types[store.scam_type[i]] == "phishing"]
+    assert fast["sessions"] == len(rows)
+    assert fast["avgTurnsToFinalize"] == round(sum(store.turns[i] for i in rows) / len(rows), 2)
+    assert fast["artifacts"]["upiIds"] == sum(store.artifacts["upiIds"][i] for i in rows)
+
+    everything = store.query(since, now + 1, 3600)["total"]
+    assert everything["sessions"] == sum(1 for i in range(store.head, len(store.ts)) if store.ts[i] >= since)
+    assert everything["byScamType"]["phishing"] == len(rows)
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def timed(fn):
+    t = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t) * 1000
+
+
+def run_all():
+    print("\nANALYTICS STORE: aggregation latency")
+    print("=" * 86)
+    print(f"{'rows':>9} | {'MB':>6} | {'24h hourly ms':>13} | {'7d daily ms':>11} | {'7d all ms':>9} | {'24h 1 type ms':>13}")
+    print("-" * 86)
+    for n in ROWS:
+        now = time.time()
+        store = SessionAnalytics(retention_s=SPAN_S + 3600, max_rows=n)
+        fill(store, n, now)
+        check_against_naive(store, now)
+
+        mb = sum(col.itemsize * len(col) for col in store._columns()) / 1e6
+        hourly = timed(lambda: store.query(now - 24 * 3600, now + 1, 3600))
+        daily = timed(lambda: store.query(now - SPAN_S, now + 1, 24 * 3600))
+        whole = timed(lambda: store.query(now - SPAN_S, now + 1, SPAN_S + 1))
+        one_type = timed(lambda: store.query(now - 24 * 3600, now + 1, 3600, "phishing"))
+        print(f"{n:>9} | {mb:>6.1f} | {hourly:>13.2f} | {daily:>11.2f} | {whole:>9.2f} | {one_type:>13.2f}")
+    print("=" * 86)
+
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import IncomingRequest  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+TURNS = [1, 10, 50]
+REPEAT = 2000
+
+SCAMMER_TEXT = "URGENT: Your SBI account is blocked. Share OTP and pay to scammer@fakeupi now."
+REPLY_TEXT = "Oh no, that sounds serious. I'm trying to verify this officially, what's the reference number?"
+
+# -------------------------------------------------
+# PAYLOADS
+# -------------------------------------------------
+
+def _msg(sender, text):
+    return {"sender": sender, "text": text, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+
+def build_payload(turn, full_history):
+    history = []
+    if full_history:
+        for _ in range(turn - 1):
+            history.append(_msg("scammer", SCAMMER_TEXT))
+            history.append(_msg("user", REPLY_TEXT))
+    return {
+        "sessionId": "bench-session",
+        "message": _msg("scammer", SCAMMER_TEXT),
+        "conversationHistory": history,
+    }
+
+
+def time_parse(raw: bytes) -> float:
+    # same work FastAPI does per request: json decode + pydantic validation
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        IncomingRequest.model_validate(json.loads(raw))
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def run_all():
+    print("\nREQUEST SIZE / PARSE TIME: full history vs server-side history (delta)")
+    print("=" * 70)
+    print(f"{'turn':>5} | {'full bytes':>10} | {'delta bytes':>11} | {'full parse us':>13} | {'delta parse us':>14}")
+    print("-" * 70)
+
+    for turn in TURNS:
+        full_raw = json.dumps(build_payload(turn, True)).encode()
+        delta_raw = json.dumps(build_payload(turn, False)).encode()
+        print(
+            f"{turn:>5} | {len(full_raw):>10} | {len(delta_raw):>11} | "
+            f"{time_parse(full_raw):>13.1f} | {time_parse(delta_raw):>14.1f}"
+        )
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    run_all()
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import importlib.util
+import subprocess
+
+import httpx
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+MAIN_PY = os.path.join(os.path.dirname(__file__), "..", "main.py")
+LOAD_SECONDS = 5
+CONCURRENCY = 64
+
+# (label, WEB_CONCURRENCY, SERVER_LOOP, SERVER_HTTP)
+CONFIGS = [
+    ("1 worker, asyncio/h11", 1, "asyncio", "h11"),
+    ("1 worker, uvloop/httptools", 1, "uvloop", "httptools"),
+    (f"{os.cpu_count()} workers, auto", os.cpu_count() or 1, "auto", "auto"),
+]
+
+# No GROQ key: every turn exercises the full pipeline but replies come from
+# the local template engine, so the numbers measure the server, not the LLM.
+BASE_ENV = {
+    "GROQ_API_KEY": "",
+    "API_SECRET_KEY": "bench-key",
+    "MIN_HUMAN_DELAY_S": "0",
+    "MAX_HUMAN_DELAY_S": "0",
+    "TENANT_RATE_PER_S": "1000000000",
+    "TENANT_BURST": "1000000000",
+    "TENANT_MAX_CONCURRENCY": "1000000",
+    "CAPTURE_PATH": "",
+}
+
+# -------------------------------------------------
+# HELPERS
+# -------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _available(loop, http):
+    need = [m for m in (loop, http) if m in ("uvloop", "httptools")]
+    return all(importlib.util.find_spec(m) for m in need)
+
+
+def start_server(workers, loop, http, port):
+    env = dict(os.environ, **BASE_ENV, WEB_CONCURRENCY=str(workers), SERVER_LOOP=loop,
+               SERVER_HTTP=http, PORT=str(port), HOST="127.0.0.1")
+    t = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, MAIN_PY], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # ready = every worker could have answered; poll until /health is 200
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                return proc, time.perf_counter() - t
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+
+
+async def load(port):
+    done = 0
+    deadline = time.perf_counter() + LOAD_SECONDS
+    limits = httpx.Limits(max_connections=CONCURRENCY)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as http:
+        async def worker(w):
+            nonlocal done
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                r = await http.post(
+                    "/api/detect",
+                    headers={"x-api-key": "bench-key"},
+                    json={"sessionId": f"w{w}-{i % 8}", "message": {"text": "Your account is blocked, pay to a@okaxis now."}},
+                )
+                if r.status_code == 200:
+                    done += 1
+
+        await asyncio.gather(*(worker(w) for w in range(CONCURRENCY)))
+    return done / LOAD_SECONDS
+
+
+def stop_server(proc):
+    t = time.perf_counter()
+    proc.send_signal(signal.SIGTERM)
+    proc.wait(timeout=60)
+    return time.perf_counter() - t
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def run_all():
+    print("\nLAUNCHER BENCHMARK (startup, req/s, SIGTERM drain)")
+    print("=" * 78)
+    print(f"{'config':>30} | {'startup s':>9} | {'req/s':>9} | {'shutdown s':>10}")
+    print("-" * 78)
+    for label, workers, loop, http in CONFIGS:
+        if not _available(loop, http):
+            print(f"{label:>30} | skipped (uvloop/httptools not installed)")
+            continue
+        port = _free_port()
+        proc, startup = start_server(workers, loop, http, port)
+        try:
+            rps = asyncio.run(load(port))
+        finally:
+            shutdown = stop_server(proc)
+        print(f"{label:>30} | {startup:>9.2f} | {rps:>9.1f} | {shutdown:>10.2f}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    run_all()
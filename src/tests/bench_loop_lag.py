@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+# In-process benchmark: LLM is stubbed out, only the analysis path does work.
+os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "bench-only"
+os.environ["API_SECRET_KEY"] = "bench-key"
+os.environ["TENANT_RATE_PER_S"] = "1000000000"
+os.environ["TENANT_BURST"] = "1000000000"
+os.environ["TENANT_MAX_CONCURRENCY"] = "1000000"
+os.environ["MIN_HUMAN_DELAY_S"] = "0"
+os.environ["MAX_HUMAN_DELAY_S"] = "0"
+os.environ.pop("CAPTURE_PATH", None)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+MODES = ["inline", "thread", "process"]
+CONCURRENCY = 32
+REQUESTS = 128
+HISTORY_MESSAGES = 60
+MESSAGE = "URGENT: account blocked. Pay to scammer@fakeupi, call +919876543210, REF-123456. " * 40
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def _stub_llm(**kwargs):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Okay, what is the reference number?"))],
+        usage=None,
+    )
+
+
+async def run_mode(mode):
+    main.ANALYSIS_EXECUTOR = mode
+    main._shutdown_analysis_executor()
+    main.LOOP_LAG.clear()
+
+    history = [{"sender": "scammer", "text": MESSAGE}] * HISTORY_MESSAGES
+    transport = httpx.ASGITransport(app=main.app)
+    lag_task = asyncio.create_task(main._monitor_loop_lag(0.005))
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def one(i):
+            async with sem:
+                r = await http.post(
+                    "/api/detect",
+                    headers={"x-api-key": "bench-key"},
+                    json={"sessionId": f"{mode}-{i}", "message": {"text": MESSAGE}, "conversationHistory": history},
+                )
+                assert r.status_code == 200, r.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+        wall = time.perf_counter() - start
+
+    lag_task.cancel()
+    report = main.loop_lag_report()
+    main._shutdown_analysis_executor()
+    return wall, report
+
+
+def run_all():
+    main.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=_stub_llm)))
+    main.log_chat = lambda sender, text: None
+
+    print("\nEVENT-LOOP LAG UNDER CONCURRENT LARGE-HISTORY TURNS")
+    print("=" * 70)
+    print(f"{'mode':>8} | {'req/s':>8} | {'lag p50 ms':>10} | {'lag p99 ms':>10} | {'lag max ms':>10}")
+    print("-" * 70)
+    for mode in MODES:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            wall, rep = asyncio.run(run_mode(mode))
+        print(
+            f"{mode:>8} | {REQUESTS / wall:>8.1f} | {rep['lagP50Ms']:>10} | "
+            f"{rep['lagP99Ms']:>10} | {rep['lagMaxMs']:>10}"
+        )
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    run_all()
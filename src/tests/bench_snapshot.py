@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# main.py is only used for its session dicts + snapshotter; no LLM calls
+os.environ.setdefault("GROQ_API_KEY", "bench-only")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+from main import HistoryEntry, SessionSnapshotter  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+TOTAL_SESSIONS = [10_000, 100_000]
+CHANGED_SESSIONS = [10, 100, 1_000]
+HISTORY_MESSAGES = 12
+
+# -------------------------------------------------
+# HELPERS
+# -------------------------------------------------
+
+def populate(n):
+    for state in main.SESSION_STATE.values():
+        state.clear()
+    main.FINAL_REPORTED.clear()
+    main.SESSION_DIRTY.clear()
+
+    history = [
+        HistoryEntry("scammer" if i % 2 == 0 else "user", f"message {i}: pay to scammer@fakeupi, REF-{100000 + i}", None)
+        for i in range(HISTORY_MESSAGES)
+    ]
+    now = time.time()
+    for i in range(n):
+        sid = f"session-{i:07d}"
+        main.SESSION_START_TIMES[sid] = now
+        main.SESSION_TURN_COUNT[sid] = HISTORY_MESSAGES // 2
+        main.SESSION_SCAM_SCORE[sid] = 12
+        main.SESSION_COUNTS[sid] = {"q": 3, "inv": 2, "rf": 4, "eli": 3}
+        main.SESSION_ASKED[sid] = {"reference", "link", "upi"}
+        main.SESSION_HISTORY[sid] = main.deque(history, maxlen=main.SESSION_HISTORY_MAX)
+        main.SESSION_HISTORY_LEN[sid] = HISTORY_MESSAGES
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def run_all():
+    print("\nSESSION SNAPSHOT COST (incremental flush)")
+    print("=" * 70)
+    print(f"{'total':>8} | {'changed':>8} | {'flush ms':>9} | {'bytes':>9} | {'load ms (all)':>13}")
+    print("-" * 70)
+
+    for total in TOTAL_SESSIONS:
+        populate(total)
+        with tempfile.TemporaryDirectory() as d:
+            snap = SessionSnapshotter(os.path.join(d, "sessions.snap"))
+            # initial full snapshot, then measure incremental ones
+            main.SESSION_DIRTY.update(main.SESSION_START_TIMES)
+            asyncio.run(snap.flush())
+            snap.stats["bytesWritten"] = 0
+
+            sids = list(main.SESSION_START_TIMES)
+            for changed in CHANGED_SESSIONS:
+                main.SESSION_DIRTY.update(sids[:changed])
+                t = time.perf_counter()
+                asyncio.run(snap.flush())
+                flush_ms = (time.perf_counter() - t) * 1000
+                bytes_written = snap.stats["bytesWritten"]
+
+                for state in main.SESSION_STATE.values():
+                    state.clear()
+                t = time.perf_counter()
+                restored = snap.load()
+                load_ms = (time.perf_counter() - t) * 1000
+                assert restored == total
+
+                print(f"{total:>8} | {changed:>8} | {flush_ms:>9.2f} | {bytes_written:>9} | {load_ms:>13.1f}")
+                snap.stats["bytesWritten"] = 0
+
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    run_all()
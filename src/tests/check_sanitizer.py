@@ -0,0 +1,71 @@
+import os
+import sys
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main  # noqa: E402
+
+# -------------------------------------------------
+# CONFIG
+# -------------------------------------------------
+
+# Persona guard: none of these may reach the scammer.
+MUST_STRIP = [
+    "honeypot", "honeypots", "bot", "bots", "chatbot", "chat bot", "AI", "AI-based", "AIs",
+    "fraud", "frauds", "fraudulent", "fraudster", "fraudsters",
+    "scam", "scams", "scammer", "scammers", "scammed", "scamming", "scamster",
+]
+
+# Ordinary words that only contain a banned word must survive intact.
+MUST_KEEP = [
+    "wait", "email", "again", "detail", "mail", "paid", "both", "bottom", "robot",
+    "about", "said", "obtain",
+]
+
+TOPICS = [
+    "reference/ticket number", "verification link", "official email address",
+    "official phone number", "UPI ID", "bank account number",
+]
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+
+def check_forms():
+    for word in MUST_STRIP:
+        out = main._sanitize_reply(f"Are you a {word} or not?")
+        assert word.lower() not in out.lower(), f"{word!r} leaked: {out!r}"
+    for word in MUST_KEEP:
+        out = main._sanitize_reply(f"Please {word} now.")
+        assert word in out, f"{word!r} was mangled: {out!r}"
+
+    sample = "Are you a scammer? Why do you keep sending scams and bots or AI-based fraudulent stuff?"
+    out = main._sanitize_reply(sample)
+    for word in ("scam", "bot", "ai-", "fraud"):
+        assert word not in out.lower(), f"{word!r} leaked: {out!r}"
+    print(f"Banned forms stripped ({len(MUST_STRIP)}), ordinary words kept ({len(MUST_KEEP)}): OK")
+
+
+def check_templates():
+    pools = [main.LOCAL_OPENERS, main.LOCAL_RED_FLAG_OPENERS]
+    asks = main.LOCAL_ASKS + main.LOCAL_INV_ASKS + main.LOCAL_STATEMENTS
+    n = 0
+    for opener, ask, topic in itertools.product(itertools.chain(*pools), asks, TOPICS):
+        reply = f"{opener} {ask.format(topic=topic)}"
+        assert main.BANNED_RE.search(reply) is None, f"template contains a banned form: {reply!r}"
+        assert main._sanitize_reply(reply) == reply, f"template changed by the sanitizer: {reply!r}"
+        n += 1
+    print(f"Local templates untouched by the sanitizer ({n} combinations): OK")
+
+
+def run_all():
+    print("\nREPLY SANITIZER CHECK")
+    print("=" * 70)
+    check_forms()
+    check_templates()
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    run_all()
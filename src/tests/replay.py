@@ -0,0 +1,298 @@
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+# Replay runs the app in-process: LLM answers come from the capture, not Groq.
+os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "replay-only"
+os.environ["API_SECRET_KEY"] = "replay-key"
+os.environ["TENANT_RATE_PER_S"] = "1000000000"
+os.environ["TENANT_BURST"] = "1000000000"
+os.environ["TENANT_MAX_CONCURRENCY"] = "1000000"
+os.environ.pop("CAPTURE_PATH", None)
+os.environ.pop("API_KEYS_JSON", None)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+
+# -------------------------------------------------
+# USAGE
+# -------------------------------------------------
+#
+#   CAPTURE_PATH=capture.jsonl.gz uvicorn src.main:app ...      # record
+#   python src/tests/replay.py run capture.jsonl.gz --speed 10 --out build_a.jsonl
+#   python src/tests/replay.py run capture.jsonl.gz --speed max --out build_b.jsonl
+#   python src/tests/replay.py run capture.jsonl.gz --speed max --no-llm-latency   # instant LLM answers
+#   python src/tests/replay.py diff build_a.jsonl build_b.jsonl
+#
+# "run" also diffs against the replies/reports stored in the capture itself.
+# LLM answers keep their recorded latency (and failures) unless --no-llm-latency,
+# so admission control, timeouts and model fallback behave as in production.
+
+# Fields that depend on wall-clock time, ignored when diffing final reports.
+VOLATILE_FINAL_FIELDS = {"engagementDurationSeconds", "engagementMetrics"}
+
+# -------------------------------------------------
+# LOG I/O
+# -------------------------------------------------
+
+def read_jsonl(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def write_jsonl(path, records):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as fh:
+        for r in records:
+            fh.write(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+# -------------------------------------------------
+# RECORDED LLM
+# -------------------------------------------------
+
+class RecordedLLM:
+    """
+    Stands in for the Groq client; answers by prompt hash, FIFO per hash.
+    Recorded failures are raised again. With simulate_latency, each answer
+    takes its recorded latency (capped at the call's timeout, which then
+    raises), so admission, timeouts and model fallback behave as captured.
+    """
+
+    def __init__(self, llm_records, simulate_latency=True):
+        self.answers = defaultdict(deque)
+        for r in llm_records:
+            self.answers[r["key"]].append(r)
+        self.simulate_latency = simulate_latency
+        self.misses = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, timeout=None, **kwargs):
+        queue = self.answers.get(main.llm_prompt_key(messages))
+        if not queue:
+            self.misses += 1
+            raise RuntimeError("no recorded completion for prompt")
+        # keep the last answer around for repeated identical prompts
+        rec = queue.popleft() if len(queue) > 1 else queue[0]
+
+        if self.simulate_latency:
+            latency = (rec.get("latencyMs") or 0) / 1000
+            if timeout is not None and latency > timeout:
+                time.sleep(max(timeout, 0))
+                raise TimeoutError("recorded latency exceeds this build's timeout")
+            time.sleep(latency)
+        if "error" in rec:
+            raise RuntimeError(f"recorded failure: {rec['error']}")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=rec["completion"]))],
+            usage=None,
+        )
+
+
+class RecordedLocalReplies:
+    """
+    Stands in for main.local_reply_for. Template replies are randomized, so
+    turns answered locally in the capture get the same template back; turns
+    the capture answered with the LLM fall back to a (seeded) fresh one.
+    """
+
+    def __init__(self, request_records, fallback):
+        self.replies = {
+            (r["body"].get("session_id"), r.get("turn")): r["localReply"]
+            for r in request_records
+            if r.get("replySource") == "local" and r.get("localReply")
+        }
+        self.fallback = fallback
+        self.misses = 0
+
+    def reply(self, session_id, hint, turn, counts):
+        text = self.replies.get((session_id, turn))
+        if text is not None:
+            return text
+        self.misses += 1
+        return self.fallback(session_id, hint, turn, counts)
+
+
+class RecordedClassifier:
+    """
+    Stands in for main.CLASSIFIER.classify. Which sessions share a batch
+    depends on timing, so replay at another speed builds prompts that were
+    never captured; answers are served per sessionId instead.
+    """
+
+    def __init__(self, classification_records, fallback):
+        # fallback: the build's own classify(), for sessions without a record
+        self.answers = {r["sessionId"]: (r["scamType"], r["confidenceLevel"]) for r in classification_records}
+        self.fallback = fallback
+        self.misses = 0
+
+    async def classify(self, session_id, full_text, *args, **kwargs):
+        if session_id in self.answers:
+            return tuple(self.answers[session_id])
+        self.misses += 1
+        return await self.fallback(session_id, full_text, *args, **kwargs)
+
+# -------------------------------------------------
+# REPLAY
+# -------------------------------------------------
+
+async def replay(requests_log, speed):
+    """
+    Open-loop replay: each request is sent at its recorded offset / speed,
+    but requests of the same session stay in order (state depends on it).
+    """
+    by_session = defaultdict(list)
+    for i, r in enumerate(requests_log):
+        sid = r["body"].get("session_id") or f"__anon_{i}"
+        by_session[sid].append((i, r))
+
+    t_first = min(r["ts"] for r in requests_log)
+    results = [None] * len(requests_log)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay") as http:
+        start = time.perf_counter()
+
+        async def run_session(items):
+            for i, r in items:
+                if speed != "max":
+                    delay = (r["ts"] - t_first) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                t = time.perf_counter()
+                resp = await http.post("/api/detect", headers={"x-api-key": "replay-key"}, json=r["body"])
+                latency_ms = (time.perf_counter() - t) * 1000
+                data = resp.json() if resp.status_code == 200 else {}
+                results[i] = {
+                    "i": i,
+                    "sessionId": r["body"].get("session_id"),
+                    "status": resp.status_code,
+                    "reply": data.get("reply"),
+                    "final": data.get("finalCallback"),
+                    "latencyMs": round(latency_ms, 2),
+                }
+
+        await asyncio.gather(*(run_session(items) for items in by_session.values()))
+
+    return results
+
+# -------------------------------------------------
+# DIFF
+# -------------------------------------------------
+
+def _stable_final(final):
+    if not final:
+        return final
+    return {k: v for k, v in final.items() if k not in VOLATILE_FINAL_FIELDS}
+
+
+def _percentiles(values):
+    v = sorted(values)
+    if not v:
+        return {}
+    return {p: round(v[min(len(v) - 1, int(len(v) * p / 100))], 2) for p in (50, 90, 95, 99)}
+
+
+def diff(base, other, base_name="base", other_name="other"):
+    reply_diffs, final_diffs = [], []
+    for a, b in zip(base, other):
+        if a.get("reply") != b.get("reply"):
+            reply_diffs.append((a["i"], a.get("reply"), b.get("reply")))
+        if _stable_final(a.get("final")) != _stable_final(b.get("final")):
+            final_diffs.append(a["i"])
+
+    print("\nREPLAY DIFF")
+    print("=" * 70)
+    print(f"Requests compared: {min(len(base), len(other))}")
+    print(f"Reply mismatches: {len(reply_diffs)}")
+    for i, ra, rb in reply_diffs[:10]:
+        print(f"  #{i}\n    {base_name}: {ra}\n    {other_name}: {rb}")
+    print(f"Final report mismatches: {len(final_diffs)} {final_diffs[:20]}")
+
+    lat_a = [r["latencyMs"] for r in base if r.get("latencyMs") is not None]
+    lat_b = [r["latencyMs"] for r in other if r.get("latencyMs") is not None]
+    if lat_a and lat_b:
+        pa, pb = _percentiles(lat_a), _percentiles(lat_b)
+        print(f"\n{'latency ms':>12} | {base_name:>12} | {other_name:>12} | {'delta':>8}")
+        for p in pa:
+            print(f"{'p' + str(p):>12} | {pa[p]:>12} | {pb[p]:>12} | {pb[p] - pa[p]:>+8.2f}")
+    print("=" * 70)
+    return not reply_diffs and not final_diffs
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+
+def cmd_run(args):
+    records = read_jsonl(args.capture)
+    requests_log = [r for r in records if r.get("kind") == "request"]
+    if not requests_log:
+        print("No requests in capture.")
+        return 1
+
+    # deterministic replay: no jitter, fixed RNG, LLM from the recording
+    random.seed(args.seed)
+    main.MIN_DELAY = main.MAX_DELAY = 0.0
+    main.log_chat = lambda sender, text: None
+    llm = RecordedLLM([r for r in records if r.get("kind") == "llm"], simulate_latency=not args.no_llm_latency)
+    main.client = llm
+    local = RecordedLocalReplies(requests_log, main.local_reply_for)
+    main.local_reply_for = local.reply
+    classifier = RecordedClassifier([r for r in records if r.get("kind") == "classification"], main.CLASSIFIER.classify)
+    main.CLASSIFIER.classify = classifier.classify
+
+    speed = "max" if args.speed == "max" else float(args.speed.rstrip("x"))
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):  # app prints final reports
+        results = asyncio.run(replay(requests_log, speed))
+    wall = time.perf_counter() - t
+
+    print(f"\nReplayed {len(results)} requests in {wall:.2f}s (speed={args.speed}, LLM misses={llm.misses}, "
+          f"local reply misses={local.misses}, classification misses={classifier.misses})")
+    if args.out:
+        write_jsonl(args.out, results)
+
+    captured = [
+        {"i": i, "reply": r.get("reply"), "final": r.get("final"), "latencyMs": (r.get("stagesMs") or {}).get("total")}
+        for i, r in enumerate(requests_log)
+    ]
+    return 0 if diff(captured, results, "captured", "replay") else 2
+
+
+def cmd_diff(args):
+    return 0 if diff(read_jsonl(args.base), read_jsonl(args.other), "base", "other") else 2
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay captured /api/detect traffic.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="replay a capture against this build")
+    run.add_argument("capture")
+    run.add_argument("--speed", default="max", help="1x, 10x, ... or max")
+    run.add_argument("--out", help="write per-request results (JSONL) for later diffs")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--no-llm-latency", action="store_true",
+                     help="answer LLM calls instantly instead of with their recorded latency")
+    run.set_defaults(func=cmd_run)
+
+    d = sub.add_parser("diff", help="diff two replay result files")
+    d.add_argument("base")
+    d.add_argument("other")
+    d.set_defaults(func=cmd_diff)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main_cli()